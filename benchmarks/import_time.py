@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+'''
+Measures the cold start of a short-lived process, i.e. importing trope and rendering one short cue in a fresh interpreter, against the same script run on a baseline tree, e.g.
+
+    python benchmarks/import_time.py --repeat 5 --baseline 1fec2f1
+
+The baseline is any git revision; by default, the repository's first commit. Its `trope` directory is exported to a temporary directory and timed as it is.
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+IMPORT = 'from performing import Performer'
+RENDER = "Performer(['C4, E4'], durations=[0.25]).audio"
+
+
+def time_statement(statement, trope_dir, repeat):
+    '''
+    Returns the median wall time, in seconds, of running `statement` from `trope_dir` in `repeat` fresh interpreters.
+    '''
+    code = (
+        'import time; start = time.perf_counter(); '
+        f'{statement}; '
+        'print(time.perf_counter() - start)'
+        )
+    timings = [
+        float(subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=trope_dir,
+            capture_output=True,
+            text=True,
+            check=True
+            ).stdout)
+        for _ in range(repeat)
+        ]
+    return statistics.median(timings)
+
+
+def export_tree(revision, directory):
+    '''
+    Writes the `trope` directory as of `revision` into `directory` and returns its path.
+    '''
+    archive = subprocess.run(['git', 'archive', revision, 'trope'], cwd=REPO_DIR, capture_output=True, check=True).stdout
+    subprocess.run(['tar', '-x', '-C', directory], input=archive, check=True)
+    return os.path.join(directory, 'trope')
+
+
+def first_commit():
+    return subprocess.run(
+        ['git', 'rev-list', '--max-parents=0', 'HEAD'],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.split()[0]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the cold start of importing trope and rendering one cue against a baseline revision.')
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per measurement; the median is reported')
+    parser.add_argument('--baseline', default=None, help='the git revision to compare against; defaults to the first commit')
+    args = parser.parse_args(argv)
+
+    baseline = args.baseline or first_commit()
+    current_dir = os.path.join(REPO_DIR, 'trope')
+
+    with tempfile.TemporaryDirectory() as directory:
+        baseline_dir = export_tree(baseline, directory)
+
+        print(f'{"":<20}{"current (s)":>13}{"baseline (s)":>14}{"speedup":>9}')
+        for label, statement in [('import', IMPORT), ('import + render', f'{IMPORT}; {RENDER}')]:
+            current = time_statement(statement, current_dir, args.repeat)
+            before = time_statement(statement, baseline_dir, args.repeat)
+            print(f'{label:<20}{current:>13.3f}{before:>14.3f}{before / current:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,4 @@
 #!/usr/bin/python3
-import librosa
 import numpy as np
 
 
@@ -13,6 +12,8 @@ class Effect:
         self.output_audio = self._delay()
 
     def _delay(self):
+        import librosa
+
         delay_params = self.__dict__.get('delay')
         # TODO: "feedback" implies the signal feeds back into itself; should rename this something like "repeats" 
         feedback, delay_time, decay, mode = delay_params
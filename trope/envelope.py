@@ -1,7 +1,7 @@
 #!/usr/bin/python3
-import librosa 
 import numpy as np
-from scipy.signal import savgol_filter
+
+from windowing import map_frames
 
 # TODO: allow end-user to specify linspace() or geomspace() 
 class Envelope:
@@ -158,8 +158,13 @@ class Envelope:
         return envelope
 
     @classmethod
-    def from_audio(cls, input_audio) -> np.array:
+    def from_audio(cls, input_audio, frame_length=None, hop_length=None, workers=None) -> np.array:
         # input is an Audio object
+        if frame_length is not None:
+            return cls._from_audio_frames(input_audio, frame_length, hop_length, workers)
+
+        import librosa
+        from scipy.signal import savgol_filter
         
         # window_length and polyorder were chose semi-arbitrarily 
         # ran through several values and this seemed to be a sweet spot
@@ -174,7 +179,30 @@ class Envelope:
         return cls(sample_rate=input_audio.sample_rate, _from_audio_envelope=normalized_envelope)
         
 
+    @classmethod
+    def _from_audio_frames(cls, input_audio, frame_length, hop_length=None, workers=None):
+        '''
+        A short-time version of from_audio() for long recordings: the envelope is the peak of each frame, `hop_length` samples apart, taken a batch of frames at a time (in parallel over `workers` threads), so the whole signal is never filtered at once.
+        '''
+        if hop_length is None:
+            hop_length = frame_length // 4
+
+        envelope = map_frames(
+            lambda frames: np.max(np.abs(frames), axis=1),
+            input_audio.audio, frame_length, hop_length, workers=workers
+            )
+
+        loudest = np.max(envelope)
+        if loudest > 0:
+            envelope = envelope / loudest
+
+        # the envelope has one value per frame, so its sample rate is the frame rate
+        frame_rate = max(1, round(input_audio.sample_rate / hop_length))
+        return cls(sample_rate=frame_rate, _from_audio_envelope=envelope)
+        
+
     def _resample_env_from_audio(self, input_signal_size):
+        import librosa
 
         target_sample_rate = int((input_signal_size / (self._from_audio_envelope.size)) * self.sample_rate)
 
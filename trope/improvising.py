@@ -2,26 +2,118 @@
 import random
 from itertools import product
 import numpy as np
-from scipy import stats
-from scipy.spatial import distance
+
+from scales_and_tunings import Scale, convert_hz_to_note
+from scoring import Score
 
 
 class Improv:
 
     def __init__(self, input): # Improv should only be taking a Performer; but it might be nicer to literally treat this as a general method :thonk: -- i.e. should this just work on random lists outside the context of trope? eh, I could always do that later-ish.
-        if hasattr(input, 'refrain'): # durations are created when a Performer object is instantiated, regardless of whether they're explicitly defined by the end-user; checking for 'refrain' should be sufficient
+        # a Score, or a Performer playing one, carries its own durations and velocities, so they can follow the pitches around
+        score = getattr(input, 'refrain', input)
+        self.score = score if isinstance(score, Score) else None
+
+        if self.score is not None:
+            self.input = self.score.pitch
+        elif hasattr(input, 'refrain'): # checking for 'refrain' should be sufficient; a Performer's durations default to [1] when they're not given, as in Performer._get_synthesis()
             self.input_refrain = input.refrain
-            self.input_durations = input.durations
+            self.input_durations = getattr(input, 'durations', [1])
         else:
             self.input = input
 
 
     def permutation(self):
 
+        if self.score is not None:
+            # shuffle whole notes, i.e. columns, so each pitch keeps its duration and velocity
+            permuted = self.score[np.random.permutation(len(self.score))]
+            return Score.from_arrays(permuted.pitch, permuted.duration, permuted.velocity)
+
         return np.random.permutation(self.input)
 
 
+    VARIATIONS = ('shuffle', 'columns', 'rotation', 'retrograde', 'inversion')
+
+    def variations(self, n, kind='shuffle', scale=None, seed=None):
+        '''
+        Returns `n` variations of the refrain at once, as an array of pitches in Hz shaped (n, voices, notes), e.g. to render with Performer(..., note_type='hz') or to batch through rendering.py.
+
+        `kind` is one of, or a list of, the following, applied in order:
+        - 'shuffle': shuffles each voice's notes independently
+        - 'columns': shuffles notes, i.e. columns, keeping every voice's notes together
+        - 'rotation': rotates every voice by the same random number of notes
+        - 'retrograde': plays the refrain backwards
+        - 'inversion': mirrors each variation's pitches around one of its own notes, chosen at random, moving by degrees of `scale` (by default, the chromatic scale); pitches outside the scale snap to its nearest degree
+
+        Rests (0 Hz) are left alone by 'inversion'. `seed` makes the variations reproducible.
+        '''
+        kinds = [kind] if isinstance(kind, str) else list(kind)
+        for k in kinds:
+            if k not in self.VARIATIONS:
+                raise ValueError(f'{k} isn\'t a variation; choose from {self.VARIATIONS}')
+
+        rng = np.random.default_rng(seed)
+        pitch = self._get_pitch()
+        voices, notes = pitch.shape
+        batch = np.broadcast_to(pitch, (n, voices, notes))
+
+        for k in kinds:
+            if k == 'shuffle':
+                order = np.argsort(rng.random((n, voices, notes)), axis=-1)
+            elif k == 'columns':
+                order = np.argsort(rng.random((n, 1, notes)), axis=-1)
+            elif k == 'rotation':
+                order = (np.arange(notes) + rng.integers(notes, size=(n, 1, 1))) % notes
+            elif k == 'retrograde':
+                order = np.arange(notes)[None, None, ::-1]
+            else:
+                batch = self._invert(batch, scale, rng)
+                continue
+            batch = np.take_along_axis(batch, order, axis=-1)
+
+        return np.array(batch)
+
+
+    def _get_pitch(self):
+        '''
+        Returns the refrain as pitches in Hz, shaped (voices, notes).
+        '''
+        if self.score is not None:
+            return np.asarray(self.score.pitch, dtype='float')
+
+        refrain = np.asarray(getattr(self, 'input_refrain', getattr(self, 'input', None)))
+        if refrain.dtype.kind in 'UO':
+            return convert_hz_to_note(refrain)
+        return np.atleast_2d(refrain).astype('float')
+
+
+    @staticmethod
+    def _invert(batch, scale, rng):
+        if scale is None:
+            scale = Scale(name='chromatic')
+        degrees = np.asarray(scale.hz)
+
+        # the nearest degree of the scale, measured in cents rather than Hz
+        playing = batch > 0
+        log_batch = np.log2(np.where(playing, batch, 1))
+        log_degrees = np.log2(degrees)
+        upper = np.clip(np.searchsorted(log_degrees, log_batch), 1, degrees.size - 1)
+        nearer_lower = (log_batch - log_degrees[upper - 1]) < (log_degrees[upper] - log_batch)
+        degree = upper - nearer_lower
+
+        # each variation mirrors around the degree of one of its own (sounding) notes
+        flat_degree = degree.reshape(len(batch), -1)
+        flat_playing = playing.reshape(len(batch), -1)
+        keys = np.where(flat_playing, rng.random(flat_degree.shape), -1)
+        axis = np.take_along_axis(flat_degree, np.argmax(keys, axis=1)[:, None], axis=1)[:, :, None]
+
+        inverted = np.clip(2 * axis - degree, 0, degrees.size - 1)
+        return np.where(playing, degrees[inverted], batch)
+
+
     def markov(self, walk_length=None):
+        from scipy import stats
 
         def _get_next(first, samples):
             next = np.nonzero(np.isin(samples, first))[0]
@@ -59,12 +151,20 @@ class Improv:
             output_if_multidimensional = []
             for i in self.input:
                 output_if_multidimensional.append(_create_markov_iteration(i))
+
+            if self.score is not None:
+                # the walk keeps the score's rhythm, repeating it if the walk is longer
+                walk = np.asarray(output_if_multidimensional)
+                columns = np.arange(walk.shape[1]) % len(self.score)
+                return Score.from_arrays(walk, self.score.duration[:, columns], self.score.velocity[:, columns])
+
             return np.asarray(output_if_multidimensional)
 
         return _create_markov_iteration(self.input)
 
 
     def rossmo(self):
+        from scipy.spatial import distance
 
         def normalize(data):
             return [(d - min(data)) / (max(data) - min(data)) for d in data]
@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+import numpy as np
+
+
+def sum_and_normalize(rows):
+    '''
+    Sums `rows` (a 2-D array, or a list of equally long 1-D arrays), dividing each sample by the number of rows that are sounding, i.e. nonzero, at it.
+
+    This is the same as librosa.util.normalize(rows, norm=0, axis=0) followed by a sum over axis 0, but it works one row at a time, so no normalized copy of the whole matrix is ever made. Since it only looks at each sample by itself, it can be applied block by block.
+    '''
+    total = None
+    for row in rows:
+        if total is None:
+            total = np.array(row, dtype='float')
+            sounding = (total != 0).astype('int')
+        else:
+            total += row
+            sounding += row != 0
+
+    if total is None:
+        return np.empty(0)
+
+    # silent samples are left as they are, as librosa does
+    return total / np.maximum(sounding, 1)
+
+
+class PeakMeter:
+    '''
+    Keeps the largest absolute sample value of every block passed through it.
+    '''
+
+    def __init__(self):
+        self.peak = 0.0
+
+    def __call__(self, block):
+        self.peak = max(self.peak, float(np.max(np.abs(block), initial=0.0)))
+        return block
+
+    def measure(self, blocks):
+        for block in blocks:
+            self(block)
+        return self.peak
+
+
+class Limiter:
+    '''
+    A lookahead peak limiter for streams of blocks: the gain is lowered ahead of any sample that would exceed `ceiling`, then eased back over `lookahead` samples, so no sample in the output exceeds `ceiling` and the gain never jumps.
+
+    The output is delayed by `lookahead` samples, i.e. the first block comes out shorter and the rest is flushed after the last block; the total length is unchanged.
+    '''
+
+    def __init__(self, ceiling=1.0, lookahead=256):
+        self.ceiling = ceiling
+        self.lookahead = lookahead
+
+    def _target_gain(self, x):
+        # the largest gain each sample can take without exceeding the ceiling
+        return self.ceiling / np.maximum(np.abs(x), self.ceiling)
+
+    def _limit(self, x, history):
+        '''
+        Returns the limited output for all but the last `lookahead - 1` samples of `x`, which are returned as the samples still pending, along with the updated history.
+        '''
+        target = self._target_gain(x)
+
+        # the lowest target gain from each sample over the next `lookahead` samples...
+        window_minimum = np.lib.stride_tricks.sliding_window_view(target, self.lookahead).min(axis=1)
+
+        # ...then averaged over the previous `lookahead` samples; every window averaged covers the current sample, so the gain never exceeds its target
+        minimums = np.concatenate((history, window_minimum))
+        cumulative = np.cumsum(np.concatenate(([0.], minimums)))
+        smoothed = (cumulative[self.lookahead:] - cumulative[:-self.lookahead]) / self.lookahead
+
+        # clamp anyway, since the history starts out at unity gain
+        gain = np.minimum(smoothed, target[:smoothed.size])
+
+        return x[:smoothed.size] * gain, x[smoothed.size:], minimums[minimums.size - (self.lookahead - 1):]
+
+    def apply(self, blocks):
+        '''
+        Yields the limited audio for an iterable of blocks.
+        '''
+        pending = np.empty(0)
+        history = np.ones(self.lookahead - 1)
+
+        for block in blocks:
+            pending = np.concatenate((pending, block))
+            if pending.size < self.lookahead:
+                continue
+            limited, pending, history = self._limit(pending, history)
+            yield limited
+
+        if pending.size:
+            # silence after the end never needs any gain reduction
+            limited, _, _ = self._limit(np.concatenate((pending, np.zeros(self.lookahead - 1))), history)
+            yield limited
@@ -1,13 +1,29 @@
 #!/usr/bin/python3
-import IPython.display as ipd
-import librosa
 import numpy as np
-from scipy.io.wavfile import write
 
 from effects import Effect
+from normalizing import PeakMeter, sum_and_normalize
+from resampling import Resampler
+from rhythm_and_meter import duration_to_time
+from scoring import Score
 from synthesizing import Synthesis
 
 
+def _rebuffer(chunks, block_size):
+    '''
+    Regroups an iterable of 1-D arrays of any length into blocks of `block_size` samples; only the last block may be shorter.
+    '''
+    pending = np.empty(0)
+    for chunk in chunks:
+        pending = np.concatenate((pending, chunk))
+        full_blocks = pending.size // block_size
+        for i in range(full_blocks):
+            yield pending[i * block_size:(i + 1) * block_size]
+        pending = pending[full_blocks * block_size:]
+    if pending.size:
+        yield pending
+
+
 class Audio:
 
     default_sample_rate = 22050
@@ -20,39 +36,61 @@ class Audio:
 
     @property
     def playtime(self):
-        return librosa.get_duration(y=self.audio, sr=self.sample_rate)
+        return self.audio.shape[-1] / self.sample_rate
     
-    # "helper" methods for normalizing and summing audio
-    def _normalize_audio(self, audio):
-        return librosa.util.normalize(audio, norm=0, axis=0, threshold=None, fill=None)
-    
-    def _sum_audio(self, audio):
-        return np.sum(audio, axis=0) 
+    # "helper" method for normalizing and summing audio
+    def _sum_and_normalize(self, audio):
+        return sum_and_normalize(audio)
 
-    # def _sum_and_normalize(self, func):
-    #     def wrapper__sum_and_normalize(*args):
-    #         return self.sum_audio(
-    #             self._normalize_audio(*args)
-    #         )
-    #     return wrapper__sum_and_normalize
+    def measure_peak(self, block_size=4096):
+        '''
+        Returns the largest absolute sample value, measured over blocks(), so audio that hasn't been rendered is synthesized block by block and never kept whole.
+        '''
+        return PeakMeter().measure(self.blocks(block_size))
 
-    def _sum_and_normalize(self, audio):
-        return self._sum_audio(self._normalize_audio(audio))
+    def normalized_blocks(self, block_size, peak=1.0):
+        '''
+        Yields the audio in blocks of `block_size` samples, scaled so that its loudest sample reaches `peak`.
+        This takes two passes over blocks(): one to measure the peak and one to scale, so nothing is held but a block at a time, at the cost of synthesizing unrendered audio twice. For a single pass, see normalizing.Limiter.
+        '''
+        loudest = self.measure_peak(block_size)
+        gain = peak / loudest if loudest > 0 else 1.0
+        for block in self.blocks(block_size):
+            yield block * gain
+
+    def blocks(self, block_size):
+        '''
+        Yields the audio in blocks of `block_size` samples; the last block may be shorter.
+        '''
+        for start in range(0, len(self.audio), block_size):
+            yield self.audio[start:start + block_size]
+
+    def resample(self, sample_rate):
+        '''
+        Returns a new Audio object converted to `sample_rate`.
+        '''
+        return Audio(Resampler(self.sample_rate, sample_rate).resample(self.audio), sample_rate)
 
     # TODO: the save() method needs _sum_and_normalize() decorator
     def save(self, filename=None, filetype='wav'):
+        from scipy.io.wavfile import write
+
         file = f'{filename}.{filetype}'
         write(filename=file, rate=self.sample_rate, data=self.audio)
 
     @classmethod
     def load(cls, file, sr=default_sample_rate, mono=True, offset=0.0, duration=None):
         # TODO: confirm whether self.sample_rate is saved properly if the end-user changes the `sr` argument
+        import librosa
+
         y, _ = librosa.load(file, sr=sr, mono=mono, offset=offset, duration=duration)
         return cls(y, sr)
 
 
     # TODO: there needs to be a check to ensure audio is summed before playing; IPython already normalizes, so I think it's superfluous to do this before playing. Only summing should be necessary.
     def play(self):
+        import IPython.display as ipd
+
         return ipd.Audio(self.audio, rate=self.sample_rate)
 
 # TODO: add concat() / endwith() methods
@@ -60,6 +98,11 @@ class Performer(Audio):
 
     DEFAULT_BPM = 120
 
+    # changing any of these means the rendered audio is stale
+    RENDER_ATTRIBUTES = ('refrain', 'durations', 'sample_rate', 'render_sample_rate', 'note_type', 'duration_type', 'tempo', 'envelope', 'timbre', 'waveform', 'effects', 'loop')
+    # changing any of these means no previously rendered note can be reused
+    FULL_RENDER_ATTRIBUTES = ('sample_rate', 'render_sample_rate', 'envelope', 'timbre', 'waveform')
+
     def __init__(
         self,
         refrain,
@@ -71,9 +114,10 @@ class Performer(Audio):
         tempo=None,
         **kwargs
         ):
-        super().__init__(sample_rate)
+        self._synthesis = None
+        super().__init__(None, sample_rate)
         
-        self.refrain = np.asarray(refrain)
+        self.refrain = refrain
         
         if sample_rate is None:
             sample_rate = self.default_sample_rate
@@ -94,64 +138,229 @@ class Performer(Audio):
 
         for k,v in kwargs.items():
             setattr(self, k, v)
-        
-        self.audio = self._create_audio()
 
-    def _create_audio(self):
+    def __setattr__(self, name, value):
+        if name == 'refrain' and not isinstance(value, Score):
+            value = np.asarray(value)
+        super().__setattr__(name, value)
+
+        if name in self.RENDER_ATTRIBUTES:
+            super().__setattr__('_audio', None)
+        if name in self.FULL_RENDER_ATTRIBUTES:
+            super().__setattr__('_synthesis', None)
+
+    @property
+    def audio(self):
+        '''
+        The rendered audio; it's only rendered when first accessed, and again after any attribute it depends on changes.
+        '''
+        if self._audio is None:
+            self._audio = self._create_audio()
+        return self._audio
+
+    @audio.setter
+    def audio(self, audio):
+        self._audio = audio
+
+    @property
+    def playtime(self):
+        '''
+        Returns the length in seconds as given by `durations` (or the Score), `tempo` and `loop`, without rendering any audio. 
+        The rendered audio can differ from this by a few samples per note, since each note is rounded to a whole number of cycles.
+        '''
+        if isinstance(self.refrain, Score):
+            playtime = self.refrain.length
+        else:
+            durations = np.asarray(getattr(self, 'durations', [1]))
+
+            if self.note_type == 'name':
+                notes_per_voice = len(str(self.refrain.ravel()[0]).split(', '))
+            else:
+                notes_per_voice = self.refrain.shape[-1]
+
+            # mirrors Synthesis, which tiles refrain and durations against each other when their lengths differ
+            if notes_per_voice != durations.size:
+                playtime = np.sum(durations) * notes_per_voice
+            else:
+                playtime = np.sum(durations)
+
+        if self.duration_type == 'beat':
+            playtime = duration_to_time(playtime, self.tempo)
+
+        loop = getattr(self, 'loop', None)
+        return float(playtime * (1 if loop is None else loop))
+
+    def update(self, **kwargs):
+        '''
+        Sets the given attributes, e.g. `refrain` or `durations`, at once. The audio is re-rendered the next time it's accessed.
+
+        Only the notes that changed are synthesized again; every other note is spliced in from the previous render, even if its position shifted. Changing `sample_rate`, `envelope`, `timbre` or `waveform` re-synthesizes every note.
+        '''
+        for k,v in kwargs.items():
+            setattr(self, k, v)
+
+    def blocks(self, block_size):
+        '''
+        Yields the audio in blocks of `block_size` samples; the last block may be shorter.
+
+        If the audio hasn't been rendered yet and there are no effects, notes are synthesized only as the blocks that need them are requested, so the first block is ready long before the whole refrain has been rendered.
+        '''
+        # effects act on the whole signal at once, so they still need a full render
+        if self._audio is not None or getattr(self, 'effects', None) is not None:
+            yield from super().blocks(block_size)
+            return
+
+        segments = self._iter_audio_segments()
+        if self.render_rate != self.sample_rate:
+            segments = Resampler(self.render_rate, self.sample_rate).apply(segments)
+
+        yield from _rebuffer(segments, block_size)
+
+    @property
+    def render_rate(self):
+        '''
+        The sample rate notes are synthesized at: `render_sample_rate` if it's set, e.g. lower than `sample_rate` for a quicker preview, otherwise `sample_rate`.
+        Audio rendered at a different rate is converted to `sample_rate` on output.
+        '''
+        render_sample_rate = getattr(self, 'render_sample_rate', None)
+        return self.sample_rate if render_sample_rate is None else render_sample_rate
+
+    def _iter_audio_segments(self):
+        loop = getattr(self, 'loop', None)
+        loop = 1 if loop is None else loop
+        if loop < 1:
+            return
+
+        # when looping, one pass over the refrain is kept so that the loops don't need to be synthesized again
+        first_pass = []
+        for segment in self._get_synthesis(synthesize=False).iter_segments():
+            summed = self._sum_and_normalize(segment)
+            if loop > 1:
+                first_pass.append(summed)
+            yield summed
+
+        for _ in range(loop - 1):
+            yield from first_pass
+
+    def _get_synthesis(self, previous=None, synthesize=True):
         durations = getattr(self, 'durations', [1])
-        effects = getattr(self, 'effects', None)
         envelope = getattr(self, 'envelope', None)
-        loop = getattr(self, 'loop', None)
         timbre = getattr(self, 'timbre', [(1,1), (1,1)]) # TODO: evenutally, remove this 'timbre' fallback (without this, a user is required to input a timbre arg, but they shouldn't have to)
+        waveform = getattr(self, 'waveform', 'sine')
 
-        y = Synthesis(
+        return Synthesis(
             input_refrain=self.refrain,
             input_durations=durations,
-            sample_rate=self.sample_rate,
+            sample_rate=self.render_rate,
             note_type=self.note_type,
             duration_type=self.duration_type,
             tempo=self.tempo,
             timbre=timbre,
-            envelope=envelope
-        ).synthesized_output
+            envelope=envelope,
+            previous=previous,
+            synthesize=synthesize,
+            waveform=waveform
+        )
+
+    def _create_audio(self):
+        effects = getattr(self, 'effects', None)
+        loop = getattr(self, 'loop', None)
+
+        self._synthesis = self._get_synthesis(previous=self._synthesis)
+        y = self._synthesis.synthesized_output
 
         if loop is not None:
-            # TODO: allow user to define a loop later, even if they've already instantiated Performer
             y = np.tile(y, loop)
 
         if effects is None:
-            return self._sum_and_normalize(y)
+            y = self._sum_and_normalize(y)
             # return y
         elif effects is not None:
             effect_y = Effect(
                 input_audio=y,
-                sample_rate=self.sample_rate,
+                sample_rate=self.render_rate,
                 **effects
             ).output_audio
-            return self._sum_and_normalize(effect_y)
+            y = self._sum_and_normalize(effect_y)
             # return effect_y
 
+        if self.render_rate != self.sample_rate:
+            y = Resampler(self.render_rate, self.sample_rate).resample(y)
+
+        return y
+
 
 class Performance(Audio):
+    '''
+    Mixes Performers together at `sample_rate`; any performer with a different sample rate is converted to it.
+    By default, `sample_rate` is the performers' own, or the highest among them when they differ, so nothing is downsampled unless asked for.
+    '''
 
     def __init__(self, performers=None, audio=None, sample_rate=None,  **kwargs):
-        super().__init__(sample_rate)
-        if performers is None:
-            self.performers = []
-        else:
-            shortest = min([len(p.audio) for p in performers])
-            self.performers = [p.audio[:shortest] for p in performers]
+        performers = [] if performers is None else list(performers)
+        if sample_rate is None and performers:
+            sample_rate = max(p.sample_rate for p in performers)
+
+        super().__init__(audio, sample_rate)
+        self.performers = performers
 
         self.__dict__.update(kwargs)
 
-        self.audio = self._create_performance()
-        if sample_rate is None:
-            sample_rate = self.default_sample_rate
-        self.sample_rate = sample_rate
+    @property
+    def audio(self):
+        '''
+        The mixed audio of every performer, trimmed to the shortest; rendered when first accessed, and again whenever a performer is added or removed or its audio changes.
+        Audio assigned directly is kept as it is.
+        '''
+        performers_audio = [p.audio for p in self.performers]
+        stale = self._performers_audio is not None and (
+            len(performers_audio) != len(self._performers_audio)
+            or any(a is not b for a, b in zip(performers_audio, self._performers_audio))
+            )
+        if self._audio is None or stale:
+            self._performers_audio = performers_audio
+            self._audio = self._create_performance(performers_audio)
+        return self._audio
+
+    @audio.setter
+    def audio(self, audio):
+        self._audio = audio
+        # None marks audio that wasn't mixed from the performers
+        self._performers_audio = None
+
+    @property
+    def playtime(self):
+        '''
+        Returns the length in seconds of the shortest performer, without rendering any audio.
+        '''
+        return min(p.playtime for p in self.performers)
+
+    def blocks(self, block_size):
+        '''
+        Yields the mixed audio in blocks of `block_size` samples, pulling each performer's blocks as they're needed; stops with the shortest performer.
+        '''
+        if self._audio is not None:
+            yield from super().blocks(block_size)
+            return
+
+        for performers_blocks in zip(*[self._performer_blocks(p, block_size) for p in self.performers]):
+            shortest = min([len(b) for b in performers_blocks])
+            yield self._sum_and_normalize([b[:shortest] for b in performers_blocks])
+            if shortest < block_size:
+                return
+
+    def _performer_blocks(self, performer, block_size):
+        if performer.sample_rate == self.sample_rate:
+            return performer.blocks(block_size)
 
-    def _create_performance(self):
+        resampler = Resampler(performer.sample_rate, self.sample_rate)
+        return _rebuffer(resampler.apply(performer.blocks(block_size)), block_size)
 
-        # TODO: incorporate summing and normalizing here
-        normalized_performers = librosa.util.normalize(self.performers, norm=0, axis=0, threshold=None, fill=None)
+    def _create_performance(self, performers_audio):
+        performers_audio = [
+            a if p.sample_rate == self.sample_rate else Resampler(p.sample_rate, self.sample_rate).resample(a)
+            for p, a in zip(self.performers, performers_audio)
+            ]
 
-        return np.sum(normalized_performers, axis=0)
\ No newline at end of file
+        shortest = min([len(a) for a in performers_audio])
+        return self._sum_and_normalize([a[:shortest] for a in performers_audio])
\ No newline at end of file
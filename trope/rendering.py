@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+'''
+Renders many cues from a manifest to WAV files, e.g.
+
+    python rendering.py cues.json --output-dir renders --jobs 4
+
+The manifest is either a JSON list of cues (or an object with a "cues" list), or a CSV file with one cue per row. Each cue takes the same arguments as Performer: `refrain`, `durations`, `tempo`, `envelope`, `timbre`, `effects`, `loop` and so on, plus an optional `name` for its output file. In a CSV, cells holding lists or objects are written as JSON.
+
+Either `timbre` or `envelope` may also be the path to an audio sample, in which case it's analyzed with Timbre or Envelope.from_audio(); each sample is only analyzed once per worker, however many cues use it. With --timbre-cache, Timbre analyses are also kept on disk and shared between workers and runs. `timbre` may also be the path to a profile saved with Timbre.save() (a .npz file).
+'''
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from envelope import Envelope
+from performing import Audio, Performer
+from timbre import Timbre
+
+
+def load_manifest(file):
+    '''
+    Returns the list of cues, i.e. dicts of Performer arguments, in a JSON or CSV manifest.
+    '''
+    with open(file, newline='') as f:
+        if file.endswith('.csv'):
+            return [
+                {k: v if k == 'name' else _parse_cell(v) for k,v in row.items() if v != ''}
+                for row in csv.DictReader(f)
+                ]
+
+        manifest = json.load(f)
+        if isinstance(manifest, dict):
+            manifest = manifest['cues']
+        return manifest
+
+
+def _parse_cell(value):
+    # CSV cells are all strings; anything that reads as JSON (numbers, lists, objects) is decoded
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value
+
+
+@lru_cache(maxsize=None)
+def _load_timbre(file, cache_dir=None):
+    if file.endswith('.npz'):
+        return Timbre.load(file).timbre
+    return Timbre(Audio.load(file), cache_dir=cache_dir).timbre
+
+
+@lru_cache(maxsize=None)
+def _load_envelope(file):
+    return Envelope.from_audio(Audio.load(file))
+
+
+def render_cue(cue, output_dir, timbre_cache=None):
+    '''
+    Renders a single cue and saves it to `output_dir`; returns the path of the file written.
+    '''
+    cue = dict(cue)
+    # a cue id may be a number, e.g. in a JSON manifest, but it's always used as a file name
+    name = str(cue.pop('name'))
+    refrain = cue.pop('refrain')
+
+    if isinstance(cue.get('timbre'), str):
+        cue['timbre'] = _load_timbre(cue['timbre'], timbre_cache)
+    if isinstance(cue.get('envelope'), str):
+        cue['envelope'] = _load_envelope(cue['envelope'])
+
+    filename = os.path.join(output_dir, name)
+    Performer(refrain, **cue).save(filename)
+    return f'{filename}.wav'
+
+
+def _render_cue(args):
+    return render_cue(*args)
+
+
+def render_manifest(cues, output_dir, jobs=None, chunksize=1, timbre_cache=None):
+    '''
+    Renders every cue with a pool of `jobs` worker processes (by default, one per CPU) and returns the paths of the files written, in manifest order.
+    `timbre_cache` is a directory where Timbre analyses are saved and looked up.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+
+    named_cues = [
+        {'name': f'cue_{i}', **cue}
+        for i, cue in enumerate(cues)
+        ]
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(
+            _render_cue,
+            [(cue, output_dir, timbre_cache) for cue in named_cues],
+            chunksize=chunksize
+            ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render every cue in a manifest to WAV files.')
+    parser.add_argument('manifest', help='a JSON or CSV file of cues')
+    parser.add_argument('-o', '--output-dir', default='.', help='where the WAV files are written')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes; defaults to one per CPU')
+    parser.add_argument('--timbre-cache', default=None, help='a directory where Timbre analyses are saved and reused across runs')
+    parser.add_argument('--chunksize', type=int, default=1, help='number of cues sent to a worker at a time')
+    args = parser.parse_args(argv)
+
+    cues = load_manifest(args.manifest)
+
+    start = time.perf_counter()
+    files = render_manifest(cues, args.output_dir, jobs=args.jobs, chunksize=args.chunksize, timbre_cache=args.timbre_cache)
+    elapsed = time.perf_counter() - start
+
+    print(f'rendered {len(files)} cues in {elapsed:.2f}s ({len(files) / elapsed:.2f} cues/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/python3
+from functools import lru_cache
+from math import ceil, gcd
+
+import numpy as np
+
+
+@lru_cache(maxsize=None)
+def _polyphase_filter(up, down):
+    '''
+    Returns the filter's half length and its polyphase decomposition, shaped (up, taps per phase), for resampling by up / down.
+    The filter is the same windowed sinc as scipy.signal.resample_poly's, and is only designed once per ratio.
+    '''
+    # the same rate in and out is a single tap of 1, i.e. a copy
+    if up == down == 1:
+        phases = np.ones((1, 1))
+        phases.setflags(write=False)
+        return 0, phases
+
+    from scipy.signal import firwin
+
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = firwin(2 * half_len + 1, 1 / max_rate, window=('kaiser', 5.0)) * up
+
+    # phase p holds every up-th tap starting at p, i.e. the taps that land on real (not zero-stuffed) input samples
+    taps_per_phase = ceil(h.size / up)
+    phases = np.zeros(up * taps_per_phase)
+    phases[:h.size] = h
+    phases = phases.reshape(taps_per_phase, up).T.copy()
+    phases.setflags(write=False)
+
+    return half_len, phases
+
+
+class Resampler:
+    '''
+    Converts audio from `orig_sr` to `target_sr` with a polyphase FIR filter, either all at once with resample(), or in blocks of any size with process() and flush() (or apply()).
+
+    Filters are cached per conversion ratio, so building many Resamplers for the same rates costs nothing after the first.
+    '''
+
+    def __init__(self, orig_sr, target_sr):
+        self.orig_sr = orig_sr
+        self.target_sr = target_sr
+
+        g = gcd(int(orig_sr), int(target_sr))
+        self.up = int(target_sr) // g
+        self.down = int(orig_sr) // g
+
+        self.half_len, self._phases = _polyphase_filter(self.up, self.down)
+        self._taps = self._phases.shape[1]
+
+        # the buffer starts with silence before the first sample, so the earliest outputs can look back
+        self._buffer = np.zeros(self._taps - 1)
+        self._buffer_start = -(self._taps - 1)
+        self._samples_in = 0
+        self._samples_out = 0
+
+    def _emit(self, stop):
+        '''
+        Returns outputs from the next one up to (not including) `stop`, dropping input that's no longer needed.
+        '''
+        m = np.arange(self._samples_out, stop)
+        n = m * self.down + self.half_len
+        newest = n // self.up - self._buffer_start
+        indices = newest[:, None] - np.arange(self._taps)[None, :]
+
+        output = np.sum(self._phases[n % self.up] * self._buffer[indices], axis=1)
+
+        self._samples_out = max(stop, self._samples_out)
+        next_newest = (self._samples_out * self.down + self.half_len) // self.up
+        drop = max(0, next_newest - (self._taps - 1) - self._buffer_start)
+        self._buffer = self._buffer[drop:]
+        self._buffer_start += drop
+
+        return output
+
+    def process(self, block):
+        '''
+        Takes the next block of input and returns as much output as it completes; the output lags the input by about `half_len / down` samples until flush().
+        '''
+        self._buffer = np.concatenate((self._buffer, block))
+        self._samples_in += len(block)
+
+        # an output is complete once the newest input sample it needs has arrived
+        stop = (self._samples_in * self.up - 1 - self.half_len) // self.down + 1
+        return self._emit(max(stop, self._samples_out))
+
+    def flush(self):
+        '''
+        Returns the rest of the output, treating everything after the last block as silence.
+        '''
+        stop = ceil(self._samples_in * self.up / self.down)
+        if stop <= self._samples_out:
+            return np.empty(0)
+
+        newest = ((stop - 1) * self.down + self.half_len) // self.up
+        padding = max(0, newest - (self._buffer_start + self._buffer.size - 1))
+        self._buffer = np.concatenate((self._buffer, np.zeros(padding)))
+
+        return self._emit(stop)
+
+    def apply(self, blocks):
+        '''
+        Yields the resampled audio for an iterable of blocks.
+        '''
+        for block in blocks:
+            yield self.process(block)
+        yield self.flush()
+
+    def resample(self, audio):
+        '''
+        Returns the whole of `audio` resampled at once, independently of any blocks passed to process().
+        The filter is applied with scipy.signal.upfirdn, which never zero-stuffs or gathers the input, so memory stays proportional to the audio rather than to the audio times the filter length.
+        '''
+        audio = np.asarray(audio, dtype='float')
+        n_out = ceil(audio.size * self.up / self.down)
+
+        if self.up == self.down:
+            return audio.copy()
+
+        from scipy.signal import upfirdn
+
+        # zeros in front of the filter put output m at input (m * down + half_len) / up, as in process()
+        pre_pad = self.down - self.half_len % self.down
+        pre_remove = (self.half_len + pre_pad) // self.down
+        h = np.concatenate((np.zeros(pre_pad), self._phases.T.ravel()))
+
+        # everything after the last sample is silence, as in flush()
+        audio = np.concatenate((audio, np.zeros(self._taps)))
+        return upfirdn(h, audio, self.up, self.down)[pre_remove:pre_remove + n_out]
@@ -1,4 +1,3 @@
-import librosa
 import numpy as np
 
 def duration_to_time(durations, bpm):
@@ -8,16 +7,121 @@ def duration_to_time(durations, bpm):
     Returns the number of seconds for the desired
 
     1 = one beat, e.g. quarter note; 0.5 = half a beat, e.g. eighth note; 0.25 a quarter of a beat, e.g. sixteenth note... and so on.
+
+    `bpm` may also be a TempoMap, in which case the durations are taken to follow one another from beat 0.
     '''
+    if isinstance(bpm, TempoMap):
+        durations = np.asarray(durations, dtype='float')
+        ends = np.cumsum(durations.ravel()).reshape(durations.shape)
+        return bpm.beats_to_seconds(ends) - bpm.beats_to_seconds(ends - durations)
+
     beat_seconds = 60 / bpm
     return np.asarray(durations) * beat_seconds
 
 
+class TempoMap:
+    '''
+    A tempo, and optionally a meter, that change over the course of a piece.
+
+    `tempos` is a list of (beat, bpm) or (beat, bpm, end_bpm) tuples, sorted by beat and starting at beat 0. Each holds `bpm` from its beat until the next entry's beat, or, if it has an `end_bpm`, ramps linearly (per beat) from `bpm` to `end_bpm` over that span. The last entry can't ramp, since it has no end.
+
+    `meters` is a list of (bar, numerator, denominator) tuples, sorted by bar and starting at bar 0, e.g. [(0, 4, 4), (8, 7, 8)]. As everywhere else, a beat is a quarter note.
+
+    Every conversion works on whole arrays of positions at once.
+    '''
+
+    def __init__(self, tempos=None, meters=None):
+        if tempos is None:
+            tempos = [(0, Rhythm.default_bpm)]
+        if meters is None:
+            meters = [(0, 4, 4)]
+
+        self.tempos = tempos
+        self.meters = meters
+
+        self.tempo_beats = np.array([t[0] for t in tempos], dtype='float')
+        self.start_bpms = np.array([t[1] for t in tempos], dtype='float')
+        self.end_bpms = np.array([t[2] if len(t) > 2 else t[1] for t in tempos], dtype='float')
+
+        if self.tempo_beats[0] != 0 or np.any(np.diff(self.tempo_beats) <= 0):
+            raise ValueError('tempos must start at beat 0 and be sorted by beat')
+        if self.end_bpms[-1] != self.start_bpms[-1]:
+            raise ValueError('the last tempo can\'t ramp, since it has no end')
+
+        # the change in bpm per beat for each segment; zero when the tempo holds
+        spans = np.diff(self.tempo_beats)
+        self._slopes = np.zeros(len(tempos))
+        self._slopes[:-1] = (self.end_bpms[:-1] - self.start_bpms[:-1]) / spans
+
+        # the time at which each segment starts
+        self._start_seconds = np.zeros(len(tempos))
+        self._start_seconds[1:] = np.cumsum(self._seconds_into_segment(np.arange(len(tempos) - 1), spans))
+
+        self.meter_bars = np.array([m[0] for m in meters], dtype='float')
+        self.beats_per_bar = np.array([m[1] * 4 / m[2] for m in meters], dtype='float')
+
+        if self.meter_bars[0] != 0 or np.any(np.diff(self.meter_bars) <= 0):
+            raise ValueError('meters must start at bar 0 and be sorted by bar')
+
+        self._meter_start_beats = np.zeros(len(meters))
+        self._meter_start_beats[1:] = np.cumsum(np.diff(self.meter_bars) * self.beats_per_bar[:-1])
+
+    def _seconds_into_segment(self, segment, beats):
+        '''
+        Returns the seconds taken to play `beats` from the start of each `segment`.
+        '''
+        bpm = self.start_bpms[segment]
+        slope = self._slopes[segment]
+
+        # integrating 60 / (bpm + slope * beat) over the beats; a held tempo is the limit as the slope goes to 0
+        ramping = slope != 0
+        safe_slope = np.where(ramping, slope, 1)
+        return np.where(
+            ramping,
+            60 / safe_slope * np.log1p(safe_slope * beats / bpm),
+            60 * beats / bpm
+            )
+
+    def _segment(self, beats):
+        return np.maximum(np.searchsorted(self.tempo_beats, beats, side='right') - 1, 0)
+
+    def bpm_at(self, beats):
+        beats = np.asarray(beats, dtype='float')
+        segment = self._segment(beats)
+        return self.start_bpms[segment] + self._slopes[segment] * (beats - self.tempo_beats[segment])
+
+    def beats_to_seconds(self, beats):
+        '''
+        Returns the time, in seconds, at which each position in `beats` (counted from beat 0) is reached.
+        '''
+        beats = np.asarray(beats, dtype='float')
+        segment = self._segment(beats)
+        return self._start_seconds[segment] + self._seconds_into_segment(segment, beats - self.tempo_beats[segment])
+
+    def beats_to_samples(self, beats, sample_rate):
+        '''
+        Returns the sample at which each position in `beats` is reached.
+        '''
+        return np.rint(self.beats_to_seconds(beats) * sample_rate).astype('int')
+
+    def bars_to_beats(self, bars):
+        '''
+        Returns the beat at which each position in `bars` (counted from bar 0; fractions are part-way through a bar) is reached.
+        '''
+        bars = np.asarray(bars, dtype='float')
+        meter = np.maximum(np.searchsorted(self.meter_bars, bars, side='right') - 1, 0)
+        return self._meter_start_beats[meter] + (bars - self.meter_bars[meter]) * self.beats_per_bar[meter]
+
+
 class Rhythm:
-    
+
     default_bpm = 120
 
     def __init__(self, bpm=None):
         if bpm is None:
             bpm = self.default_bpm
-        self.bpm = bpm
\ No newline at end of file
+        self.bpm = bpm
+
+    @property
+    def tempo_map(self):
+        return TempoMap([(0, self.bpm)])
@@ -1,7 +1,7 @@
 #!/usr/bin/python3
+import re
 from dataclasses import dataclass
 from typing import List
-from librosa import note_to_hz
 import numpy as np
 
 NOTES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
@@ -12,6 +12,35 @@ NOTES_FLAT = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
 
 CHORD_ORDER = ['major', 'minor', 'minor', 'major', 'major', 'minor', 'diminished'] # "default"
 
+# semitones above C for each letter, and the offset of each accidental, as librosa spells them
+PITCH_CLASSES = {'C': 0, 'D': 2, 'E': 4, 'F': 5, 'G': 7, 'A': 9, 'B': 11}
+ACCIDENTALS = {'#': 1, '♯': 1, '𝄪': 2, 'b': -1, '!': -1, '♭': -1, '𝄫': -2, '♮': 0}
+
+NOTE_PATTERN = re.compile(r'^(?P<letter>[A-Ga-g])(?P<accidental>[#♯𝄪b!♭𝄫♮]*)(?P<octave>[+-]?\d+)?(?P<cents>[+-]\d+)?$')
+
+def note_to_hz(notes):
+    '''
+    Returns the frequency of each note name, e.g. 'C4', 'F#3' or 'Bb5', with A4 at 440 Hz; the same as librosa.note_to_hz, without importing librosa.
+    A note without an octave is in octave 0. Cents may follow the octave, e.g. 'A4+30', but as in librosa they're rounded to the nearest semitone.
+    '''
+    notes = np.asarray(notes)
+    unique, inverse = np.unique(notes, return_inverse=True)
+
+    midi = np.empty(unique.shape)
+    for i, note in enumerate(unique):
+        match = NOTE_PATTERN.match(note.strip())
+        if match is None:
+            raise ValueError(f'{note!r} isn\'t a note name')
+        midi[i] = (
+            12 * (int(match['octave'] or 0) + 1)
+            + PITCH_CLASSES[match['letter'].upper()]
+            + sum(ACCIDENTALS[a] for a in match['accidental'])
+            + int(match['cents'] or 0) / 100
+            )
+    midi = np.round(midi)
+
+    return (440 * 2 ** ((midi - 69) / 12))[inverse].reshape(notes.shape)
+
 def convert_hz_to_note(notes_arr):
     split_notes_arr = np.asarray([n.split(', ') for n in notes_arr.ravel()])
     return note_to_hz(split_notes_arr)
@@ -70,12 +99,9 @@ class Scale:
         '''
         Returns the values in hz for a Scale object.
         '''
-        # TODO: calling note_to_hz() twice in this method is redundant; quick and dirty way to ensure sorting is correct, but should be fixed at some point
-        notes_list = sorted([f'{n}{i}' for n in self.notes for i in range(1,9)], key=lambda x:note_to_hz(x))
-        hz_arr = note_to_hz(
-            notes_list[notes_list.index(f'{self.root}1'):]
-            )
-        return hz_arr
+        notes_list = [f'{n}{i}' for n in self.notes for i in range(1,9)]
+        hz_arr = np.sort(note_to_hz(notes_list))
+        return hz_arr[hz_arr >= note_to_hz(f'{self.root}1')]
 
     def _get_chord_order(self):
         # returns the order of chord types for the current scale / mode 
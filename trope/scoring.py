@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+import numpy as np
+
+from scales_and_tunings import convert_hz_to_note
+
+
+class Score:
+    '''
+    A compact, array-backed score: a structured array shaped (voices, notes) holding each note's pitch in Hz, duration and velocity as float32.
+
+    Durations are in the same units, i.e. beats or seconds, as the Performer's `duration_type`. Every voice has the same number of notes; each column starts once the longest note of the previous column has ended, just as Synthesis lays out a refrain, so onsets follow from the durations rather than being stored.
+
+    Synthesis, Performer and Improv all take a Score in place of a refrain, so a large generated score never needs to be written out as, or parsed from, note names.
+    '''
+
+    dtype = np.dtype([
+        ('pitch', 'float32'),
+        ('duration', 'float32'),
+        ('velocity', 'float32'),
+    ])
+
+    __slots__ = ('notes',)
+
+    def __init__(self, notes):
+        self.notes = np.atleast_2d(np.asarray(notes, dtype=self.dtype))
+
+    @classmethod
+    def from_arrays(cls, pitch, durations, velocity=1.0):
+        '''
+        `pitch` is shaped (voices, notes) in Hz, with 0 for a rest; `durations` and `velocity` are broadcast against it, so one duration per note (shared by every voice) or one per voice and note both work.
+        '''
+        pitch = np.atleast_2d(pitch)
+        durations = np.broadcast_to(durations, pitch.shape)
+
+        notes = np.empty(pitch.shape, dtype=cls.dtype)
+        notes['pitch'] = pitch
+        notes['duration'] = durations
+        notes['velocity'] = np.broadcast_to(velocity, pitch.shape)
+
+        return cls(notes)
+
+    @classmethod
+    def from_refrain(cls, refrain, durations=None, velocity=1.0):
+        '''
+        Parses a refrain of note names, e.g. [['C4, E4, G4'], ['E4, G4, B4']], once, lining it up with `durations` the same way Synthesis does.
+        '''
+        if durations is None:
+            durations = [1]
+        pitch = convert_hz_to_note(np.asarray(refrain))
+        durations = np.asarray(durations)
+
+        # mirrors Synthesis, which tiles refrain and durations against each other when their lengths differ
+        if pitch.shape[1] != durations.shape[0]:
+            pitch, durations = np.tile(pitch, len(durations)), np.tile(durations, pitch.shape[1])
+
+        return cls.from_arrays(pitch, durations, velocity)
+
+    @classmethod
+    def from_midi(cls, midi, durations, velocity=1.0):
+        '''
+        As from_arrays(), but with pitch given as MIDI note numbers; a negative number is a rest.
+        '''
+        midi = np.atleast_2d(midi)
+        pitch = np.where(midi < 0, 0, 440 * 2 ** ((midi - 69) / 12))
+        return cls.from_arrays(pitch, durations, velocity)
+
+    @property
+    def pitch(self):
+        return self.notes['pitch']
+
+    @property
+    def onset(self):
+        '''
+        Returns when each note starts, i.e. once the longest note of the previous column has ended.
+        '''
+        column_durations = np.max(self.duration, axis=0)
+        return np.broadcast_to(np.cumsum(column_durations) - column_durations, self.shape)
+
+    @property
+    def duration(self):
+        return self.notes['duration']
+
+    @property
+    def velocity(self):
+        return self.notes['velocity']
+
+    @property
+    def midi(self):
+        '''
+        Returns each pitch as the nearest MIDI note number, with -1 for rests.
+        '''
+        with np.errstate(divide='ignore'):
+            midi = np.rint(69 + 12 * np.log2(self.pitch / 440))
+        return np.where(self.pitch > 0, midi, -1).astype('int')
+
+    @property
+    def shape(self):
+        return self.notes.shape
+
+    @property
+    def voices(self):
+        return self.notes.shape[0]
+
+    @property
+    def length(self):
+        '''
+        Returns the total length, in the same units as the durations.
+        '''
+        return float(np.sum(np.max(self.duration, axis=0)))
+
+    def __len__(self):
+        return self.notes.shape[1]
+
+    def __getitem__(self, notes):
+        # index notes, i.e. columns, keeping every voice; a single note stays a column
+        if isinstance(notes, (int, np.integer)):
+            notes = slice(notes, notes + 1 or None)
+        return Score(self.notes[:, notes])
+
+    def __repr__(self):
+        return f'Score(voices={self.voices}, notes={len(self)}, length={self.length:g})'
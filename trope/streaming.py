@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+import asyncio
+import time
+
+import numpy as np
+
+
+class NullSink:
+    '''
+    Discards every block it's given, only counting them; useful for testing and for timing renders.
+    '''
+
+    realtime = False
+
+    def __init__(self):
+        self.blocks_written = 0
+        self.samples_written = 0
+
+    async def open(self, sample_rate):
+        self.sample_rate = sample_rate
+
+    async def write(self, block):
+        self.blocks_written += 1
+        self.samples_written += len(block)
+
+    async def close(self):
+        pass
+
+
+class FileSink:
+    '''
+    Writes each block to an audio file as it arrives, so the whole piece never needs to be held in memory.
+    '''
+
+    realtime = False
+
+    def __init__(self, filename, filetype='wav'):
+        self.filename = filename
+        self.filetype = filetype
+        self._file = None
+
+    async def open(self, sample_rate):
+        import soundfile
+
+        # DOUBLE matches what Audio.save() writes for a float64 signal
+        self._file = soundfile.SoundFile(
+            f'{self.filename}.{self.filetype}',
+            mode='w',
+            samplerate=sample_rate,
+            channels=1,
+            subtype='DOUBLE'
+            )
+
+    async def write(self, block):
+        self._file.write(block)
+
+    async def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class DeviceSink:
+    '''
+    Stands in for a local audio device: each block takes as long to "play" as it lasts, so the engine has to keep up in real time.
+    If `record` is True, the played blocks (including any silence from underruns) are kept in `played`.
+    '''
+
+    realtime = True
+
+    def __init__(self, record=False):
+        self.record = record
+        self.played = []
+
+    async def open(self, sample_rate):
+        self.sample_rate = sample_rate
+        self._next_deadline = None
+
+    async def write(self, block):
+        # the device clock runs independently of how long each write took to arrive
+        now = time.perf_counter()
+        if self._next_deadline is None or self._next_deadline < now:
+            self._next_deadline = now
+        self._next_deadline += len(block) / self.sample_rate
+
+        if self.record:
+            self.played.append(block)
+
+        await asyncio.sleep(self._next_deadline - time.perf_counter())
+
+    async def close(self):
+        pass
+
+
+class Engine:
+    '''
+    Renders `source` (an Audio, Performer or Performance) in blocks of `block_size` samples and feeds them to `sink`, while up to `lookahead` blocks are rendered ahead of it.
+
+    If a `limiter` (e.g. normalizing.Limiter) is given, blocks pass through it before reaching the sink, so levels are kept in check without a pass over the whole piece.
+
+    Output starts as soon as the first block is rendered. When a real-time sink is ready for a block that hasn't been rendered yet, a block of silence is written in its place and the index of the late block is appended to `underruns`.
+    '''
+
+    def __init__(self, source, sink, block_size=1024, lookahead=4, limiter=None):
+        self.source = source
+        self.sink = sink
+        self.block_size = block_size
+        self.lookahead = lookahead
+        self.limiter = limiter
+
+        self.underruns = []
+        self.blocks_written = 0
+        self.latency = None # seconds from the start of run() until the first block reached the sink
+
+    async def _render(self, queue):
+        loop = asyncio.get_running_loop()
+        blocks = self.source.blocks(self.block_size)
+        if self.limiter is not None:
+            blocks = self.limiter.apply(blocks)
+        try:
+            while True:
+                # render off the event loop, so a real-time sink is never kept waiting on synthesis
+                block = await loop.run_in_executor(None, next, blocks, None)
+                if block is None:
+                    break
+                await queue.put(block)
+        finally:
+            await queue.put(None)
+
+    async def _output(self, queue, start):
+        silence = np.zeros(self.block_size)
+
+        while True:
+            # the first block is startup latency, not an underrun
+            if queue.empty() and self.sink.realtime and self.blocks_written > 0:
+                self.underruns.append(self.blocks_written)
+                await self.sink.write(silence)
+                continue
+
+            block = await queue.get()
+            if block is None:
+                return
+
+            if self.latency is None:
+                self.latency = time.perf_counter() - start
+            await self.sink.write(block)
+            self.blocks_written += 1
+
+    async def run(self):
+        queue = asyncio.Queue(maxsize=self.lookahead)
+        start = time.perf_counter()
+
+        await self.sink.open(self.source.sample_rate)
+        try:
+            await asyncio.gather(self._render(queue), self._output(queue, start))
+        finally:
+            await self.sink.close()
+
+        return self
+
+
+def stream(source, sink=None, block_size=1024, lookahead=4, limiter=None):
+    '''
+    Runs an Engine to completion from synchronous code and returns it, e.g. to inspect `underruns` and `latency`.
+    Inside an already running event loop (e.g. a notebook), use `await Engine(...).run()` instead.
+    '''
+    if sink is None:
+        sink = NullSink()
+    return asyncio.run(Engine(source, sink, block_size=block_size, lookahead=lookahead, limiter=limiter).run())
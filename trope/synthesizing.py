@@ -1,11 +1,47 @@
 #!/usr/bin/python3
-import librosa
+from collections import OrderedDict
 from math import ceil
 import numpy as np
 
 from envelope import Envelope
 from scales_and_tunings import convert_hz_to_note
-from rhythm_and_meter import duration_to_time
+from rhythm_and_meter import TempoMap, duration_to_time
+from scoring import Score
+
+WAVEFORMS = ['sine', 'saw', 'square', 'triangle']
+
+
+def _polyblep(phase, increment):
+    '''
+    Returns the polynomial band-limited step (PolyBLEP) residual for a waveform that jumps down by 2 whenever `phase` (in cycles, from 0 to 1) wraps around; `increment` is the phase advanced per sample.
+    Only samples within one sample of the jump are nonzero.
+    '''
+    residual = np.zeros_like(phase)
+
+    after = phase < increment
+    t = phase[after] / increment
+    residual[after] = 2 * t - t ** 2 - 1
+
+    before = phase > 1 - increment
+    t = (phase[before] - 1) / increment
+    residual[before] = t ** 2 + 2 * t + 1
+
+    return residual
+
+
+def _polyblamp(phase, increment):
+    '''
+    Returns the polynomial band-limited ramp (PolyBLAMP) residual, i.e. the integral of the PolyBLEP residual, for a unit change in slope per sample whenever `phase` wraps around.
+    '''
+    residual = np.zeros_like(phase)
+
+    after = phase < increment
+    residual[after] = (1 - phase[after] / increment) ** 3 / 6
+
+    before = phase > 1 - increment
+    residual[before] = (1 + (phase[before] - 1) / increment) ** 3 / 6
+
+    return residual
 
 
 # TODO: make this an implied private class, `_Synthesis`
@@ -21,31 +57,62 @@ class Synthesis:
         tempo,
         envelope=None,
         timbre=None,
+        previous=None,
+        synthesize=True,
+        waveform='sine',
         ):
-        # TODO: enforce 2-dimensionality of refrain and 1-dimensionality of durations
-        self.input_refrain = np.asarray(input_refrain) 
-        self.input_durations = np.asarray(input_durations)
+        '''
+        `previous` is an earlier Synthesis of the same voices with the same envelope and timbre; any of its segments whose notes are unchanged are reused rather than synthesized again.
+        With `synthesize=False` nothing is rendered up front; use iter_segments() to render one column at a time instead.
+        `input_refrain` may also be a Score, in which case `input_durations` and `note_type` are ignored.
+        `tempo` may also be a TempoMap, in which case each note lasts as long as the tempo at its position allows, and sample_boundaries follow the map's beat grid.
+        `waveform` is one of WAVEFORMS; anything other than a sine is band-limited, so even a single row has a full set of partials without aliasing.
+        '''
+        if waveform not in WAVEFORMS:
+            raise ValueError(f'waveform must be one of {WAVEFORMS}, not {waveform!r}')
+        self.waveform = waveform
+
+        # a Score is already in Hz and already lines each note up with its own duration, so there's nothing to parse or tile
+        self.score = input_refrain if isinstance(input_refrain, Score) else None
+
+        if self.score is not None:
+            self.input_refrain = self.score.pitch.astype('float')
+            self.input_durations = self.score.duration.astype('float')
+        else:
+            # TODO: enforce 2-dimensionality of refrain and 1-dimensionality of durations
+            self.input_refrain = np.asarray(input_refrain) 
+            self.input_durations = np.asarray(input_durations)
         self.sample_rate = sample_rate
         self.note_type = note_type
         self.duration_type = duration_type
         self.tempo = tempo
         self.envelope = envelope
-        self.timbre = timbre
+        # a Timbre object can be passed as is
+        self.timbre = timbre.timbre if hasattr(timbre, 'overtones') else timbre
+        self.tempo_map = tempo if isinstance(tempo, TempoMap) else None
 
-        if self.note_type == 'name':
+        if self.note_type == 'name' and self.score is None:
             # TODO: add exception handling and check if all values are strings, e.g. all([notes.dtype.type is np.str_ for r in self.input_refrain for notes in r])
             self.input_refrain = convert_hz_to_note(self.input_refrain)
 
-        if self.duration_type == 'beat':
+        # with a tempo map, a note's length in seconds depends on where it falls, so beats are converted once the columns are laid out
+        if self.duration_type == 'beat' and self.tempo_map is None:
             self.input_durations = duration_to_time(self.input_durations, self.tempo)
 
-        if self.input_refrain.shape[1] != self.input_durations.shape[0]:
+        if self.score is not None:
+            self.refrain = self.input_refrain
+            self.durations = self.input_durations
+            self.velocities = self.score.velocity.astype('float')
+        elif self.input_refrain.shape[1] != self.input_durations.shape[0]:
             # ensure they have the same size by tiling, create 'refrain' and 'durations' attributes
             self.refrain = np.tile(self.input_refrain, len(self.input_durations))
             self.durations = np.tile(self.input_durations, self.input_refrain.shape[1])
         else:
             self.refrain = self.input_refrain
             self.durations = self.input_durations
+
+        if self.score is None:
+            self.velocities = np.ones(self.refrain.shape)
         
         # if a timbre value is provided, use that to set refrain to include the timbre values
         if self.timbre is not None:
@@ -53,30 +120,103 @@ class Synthesis:
                     [self.refrain * factor for (factor,_) in self.timbre], 
                     (self.refrain.shape[0] * len(self.timbre), self.refrain.shape[-1])
                     )
+            self.velocities = np.tile(self.velocities, (len(self.timbre), 1))
+            # durations given per voice, i.e. from a Score, need a row for each timbre as well
+            if self.durations.ndim == 2:
+                self.durations = np.tile(self.durations, (len(self.timbre), 1))
+
+        # each row of refrain gets the amplitude of its timbre entry; every voice shares the same timbre
+        # an amplitude may also be an array, i.e. a curve over time from Timbre.windowed()
+        if self.timbre is not None:
+            voices = self.refrain.shape[0] // len(self.timbre)
+            self.amplitudes = [amp for (_,amp) in self.timbre for _ in range(voices)]
+        else:
+            # TODO - this 0.5 default value for amp could be specified elsewhere, especially to allow the end-user to set it themselves
+            self.amplitudes = np.full(self.refrain.shape[0], 0.5)
+
+        if self.duration_type == 'beat' and self.tempo_map is not None:
+            column_edges = self._map_tempo()
 
         self._vectorized_get_duration_in_samples = np.vectorize(self._get_duration_in_samples)
 
         self.durations_in_samples = self._vectorized_get_duration_in_samples(self.refrain, self.durations)
 
-        self.max_durations_samples = np.max(self.durations_in_samples, axis=0).astype('int')
+        if self.duration_type == 'beat' and self.tempo_map is not None:
+            # a note rounded up to a whole cycle mustn't spill over into the next column
+            self.sample_boundaries = column_edges[:-1]
+            self.max_durations_samples = np.diff(column_edges)
+            self.durations_in_samples = np.minimum(self.durations_in_samples, self.max_durations_samples)
+        else:
+            self.max_durations_samples = np.max(self.durations_in_samples, axis=0).astype('int')
+
+            _cumsum_max_durations = np.ravel(np.cumsum(self.max_durations_samples))
+            self.sample_boundaries = np.insert(_cumsum_max_durations[:-1], 0, 0)
+        self.total_duration_in_samples = np.sum(self.max_durations_samples, dtype='int')
+
+        # a segment is every row of a single column, i.e. one note per voice and timbre;
+        # its rendered samples depend only on these values, not on where it sits in the output
+        _durations = np.broadcast_to(self.durations, self.refrain.shape)
+        self.segment_keys = [
+            tuple(self.refrain[:, column]) + tuple(_durations[:, column]) + tuple(self.velocities[:, column]) + (self.max_durations_samples[column],)
+            for column in range(self.refrain.shape[1])
+            ]
+
+        self._envelope = self._get_envelope()
+
+        if synthesize:
+            self.synthesized_output = self._synthesize(previous)
 
-        _cumsum_max_durations = np.ravel(np.cumsum(self.max_durations_samples))
-        self.sample_boundaries = np.insert(_cumsum_max_durations[:-1], 0, 0)
 
-        self.synthesized_output = self._synthesize()
+    def _map_tempo(self):
+        '''
+        Converts self.durations from beats to seconds with self.tempo_map, each note according to the tempo from its column's onset.
+        Returns the sample at which each column starts, plus the sample at which the last one ends, in one vectorized pass.
+        '''
+        durations = np.broadcast_to(self.durations, self.refrain.shape)
+
+        # a column lasts as long as its longest note
+        column_edges = np.concatenate(([0.], np.cumsum(np.max(durations, axis=0))))
+        onsets = column_edges[:-1]
+
+        self.durations = self.tempo_map.beats_to_seconds(onsets + durations) - self.tempo_map.beats_to_seconds(onsets)
+
+        return self.tempo_map.beats_to_samples(column_edges, self.sample_rate)
 
 
     def _generate_tone(self, frequency, duration_in_samples, amplitude=0.5, pad_amount=0):
         each_sample = np.arange(duration_in_samples)
-        sine = np.sin(2 * np.pi * each_sample * frequency / self.sample_rate) * amplitude
+        tone = self._oscillate(each_sample, frequency) * amplitude
 
         if pad_amount - duration_in_samples > 0:
             pad_for_each_side = (pad_amount - duration_in_samples) / 2
             beginning = int(pad_for_each_side)
             end = ceil(pad_for_each_side)
-            return np.pad(sine, (beginning, end)) # note: also works for rests
+            return np.pad(tone, (beginning, end)) # note: also works for rests
+
+        return tone
 
-        return sine
+
+    def _oscillate(self, each_sample, frequency):
+        '''
+        Returns one pass of the oscillator, between -1 and 1, for `self.waveform`.
+        '''
+        if self.waveform == 'sine':
+            return np.sin(2 * np.pi * each_sample * frequency / self.sample_rate)
+
+        increment = frequency / self.sample_rate
+        phase = (each_sample * increment) % 1
+
+        if self.waveform == 'saw':
+            return 2 * phase - 1 - _polyblep(phase, increment)
+
+        if self.waveform == 'square':
+            # a square is a step up at the start of each cycle and a step down halfway through
+            square = np.where(phase < 0.5, 1., -1.)
+            return square + _polyblep(phase, increment) - _polyblep((phase + 0.5) % 1, increment)
+
+        # a triangle's slope turns from falling to rising at the start of each cycle and back halfway through; 8 * increment is the change in slope per sample
+        triangle = 1 - 4 * np.abs(phase - 0.5)
+        return triangle + 8 * increment * (_polyblamp(phase, increment) - _polyblamp((phase + 0.5) % 1, increment))
 
 
     def _get_duration_in_samples(self, frequency, duration_in_seconds):
@@ -95,51 +235,109 @@ class Synthesis:
 
     def _initialize_matrix(self):
         '''
-        Sets self.total_duration_in_samples.
         Returns a matrix for the entire Synthesis object, i.e. allocates space in memory in advance.
         '''
-        self.total_duration_in_samples = np.sum(self.max_durations_samples, dtype='int')
         return np.empty((self.refrain.shape[0], self.total_duration_in_samples))
 
 
-    def _synthesize(self):
-        output = self._initialize_matrix()
+    def _get_envelope(self):
+        if self.envelope is None:
+            return Envelope.base(sample_rate=self.sample_rate)
+        # if we've an envelope generated directly from audio, the envelope will simply be the user-defined instance of the class
+        elif hasattr(self.envelope, '_from_audio_envelope'):
+            return self.envelope
+        return Envelope(*self.envelope, sample_rate=self.sample_rate)
+
 
-        t = iter(self.timbre) if self.timbre is not None else False
-        counter = 0
+    def _get_amplitude(self, row, duration_in_samples):
+        amplitude = self.amplitudes[row]
+        if np.ndim(amplitude) == 0:
+            return amplitude
 
-        for i,r in np.ndenumerate(self.refrain):
-            # use this counter to grab the next value from t, i.e. self.timbre
-            if counter == 0:
-                # TODO - this 0.5 default value for amp could be specified elsewhere, especially to allow the end-user to set it themselves
-                amp = next(t)[1] if t else 0.5 
-            counter += 1
-            if counter / (self.refrain.size / len(self.timbre)) == 1:
-                counter = 0
+        # a curve over time is stretched over the length of the note
+        curve = np.asarray(amplitude)
+        return np.interp(
+            np.linspace(0, curve.size - 1, int(duration_in_samples)),
+            np.arange(curve.size),
+            curve
+            )
 
+
+    def _render_segment(self, column):
+        '''
+        Returns the rendered samples for every row of a single column, shaped (rows, max_durations_samples[column]).
+        '''
+        segment = np.empty((self.refrain.shape[0], self.max_durations_samples[column]))
+
+        for row, frequency in enumerate(self.refrain[:, column]):
             tone = self._generate_tone(
-                frequency=r,
-                duration_in_samples=self.durations_in_samples[i], 
-                amplitude=amp,
-                pad_amount=self.max_durations_samples[i[1]]
+                frequency=frequency,
+                duration_in_samples=self.durations_in_samples[row, column], 
+                amplitude=self._get_amplitude(row, self.durations_in_samples[row, column]) * self.velocities[row, column],
+                pad_amount=self.max_durations_samples[column]
                 )
 
-            # set envelope
-            if self.envelope is None: 
-                E = Envelope.base(sample_rate=self.sample_rate)
+            env = self._envelope.generate_envelope_signal(tone)
+            tone *= env
+
+            segment[row, :tone.size] = tone
+
+        return segment
 
-            # if we've an envelope generated directly from audio, the envelope will simply be the user-defined instance of the class
-            # TODO: make this a bit smarter; can I self.__dict__.get or something like that? 
-            elif hasattr(self.envelope, '_from_audio_envelope'):
-                if self.envelope._from_audio_envelope is not None:
-                    E = self.envelope
+
+    def iter_segments(self, cache_size=32):
+        '''
+        Yields the rendered segment for each column in order, without allocating the whole output matrix.
+        A note repeated within the last `cache_size` distinct notes isn't rendered again; older segments are let go, so memory stays bounded however long the refrain is.
+        '''
+        rendered = OrderedDict()
+        for column, key in enumerate(self.segment_keys):
+            if key in rendered:
+                rendered.move_to_end(key)
             else:
-                E = Envelope(*self.envelope, sample_rate=self.sample_rate)
-            
-            env = E.generate_envelope_signal(tone)
-            tone *= env
+                rendered[key] = self._render_segment(column)
+                if len(rendered) > cache_size:
+                    rendered.popitem(last=False)
+            yield rendered[key]
 
-            output[i[0], self.sample_boundaries[i[1]] : self.sample_boundaries[i[1]]+tone.size] = tone
+
+    def _synthesize(self, previous=None):
+        if previous is None:
+            previous_segments = {}
+        else:
+            previous_segments = dict(zip(previous.segment_keys, previous.segments))
+
+        # when every boundary is where it was, splice the changed columns into the previous buffer in place
+        in_place = (
+            previous is not None
+            and np.array_equal(previous.sample_boundaries, self.sample_boundaries)
+            and previous.synthesized_output.shape == (self.refrain.shape[0], self.total_duration_in_samples)
+            )
+
+        if in_place:
+            output = previous.synthesized_output
+            columns = [c for c, key in enumerate(self.segment_keys) if key != previous.segment_keys[c]]
+        else:
+            output = self._initialize_matrix()
+            columns = range(len(self.segment_keys))
+
+        # gather every segment before writing any, since a reused segment may be a view into the very buffer being written
+        segments = []
+        for column in columns:
+            segment = previous_segments.get(self.segment_keys[column])
+            if segment is None:
+                segment = self._render_segment(column)
+            elif in_place:
+                segment = segment.copy()
+            segments.append(segment)
+
+        for column, segment in zip(columns, segments):
+            boundary = self.sample_boundaries[column]
+            output[:, boundary:boundary + segment.shape[1]] = segment
+
+        self.segments = [
+            output[:, boundary:boundary + width]
+            for boundary, width in zip(self.sample_boundaries, self.max_durations_samples)
+            ]
 
         return output
-    
\ No newline at end of file
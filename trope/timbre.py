@@ -1,12 +1,13 @@
 #!/usr/bin/python3
+import hashlib
+import os
 from typing import List, Tuple
 
-import librosa
 import numpy as np
-from scipy.signal import find_peaks_cwt
-from scipy.stats import mode
 
 from performing import Audio
+from resampling import Resampler
+from windowing import map_frames
 
 
 # TODO: for uniformity's sake, I should probably make this functionally similar to Envelope; the user could use a similar `from_audio()`-type method
@@ -16,36 +17,184 @@ from performing import Audio
 class Timbre:
     '''
     Heavily influenced by: https://mapio.github.io/sinuous-violin/
+
+    The analysis is kept as two arrays, `overtones` and `amplitudes`, so a Timbre can be reused for any number of Performers, saved with save() and loaded with load().
+    Analyses are cached by the content of the audio: analyzing the same audio again in this process costs nothing, and with a `cache_dir` (by default, Timbre.cache_dir) each analysis is also written there and loaded from there by later processes.
     '''
+
+    cache_dir = None
+
+    # analyses done in this process, keyed by content_hash()
+    _cache = {}
+
     def __init__(
         self, 
-        audio
+        audio,
+        cache_dir=None
         ):
         self.audio = audio
 
         self.audio_to_process = self.audio.audio
         self.sample_rate = self.audio.sample_rate 
 
-        self.timbre = self._get_timbre()
+        if cache_dir is None:
+            cache_dir = self.cache_dir
+        key = self.content_hash(audio)
+        cache_file = None if cache_dir is None else os.path.join(cache_dir, f'{key}.npz')
+
+        on_disk = cache_file is not None and os.path.exists(cache_file)
+
+        if key in self._cache:
+            self.overtones, self.amplitudes = self._cache[key]
+        elif on_disk:
+            loaded = self.load(cache_file)
+            self.overtones, self.amplitudes = loaded.overtones, loaded.amplitudes
+        else:
+            self.overtones, self.amplitudes = self._get_timbre()
+
+        # an analysis found in memory is still written to the cache directory, so other processes can find it
+        if cache_file is not None and not on_disk:
+            # written under another name first, so another process never loads a half-written file
+            os.makedirs(cache_dir, exist_ok=True)
+            partial_file = os.path.join(cache_dir, f'{key}.{os.getpid()}.npz')
+            self.save(partial_file)
+            os.replace(partial_file, cache_file)
+
+        self._cache[key] = (self.overtones, self.amplitudes)
+
+    @staticmethod
+    def content_hash(audio):
+        '''
+        Returns a hash of the samples and sample rate of an Audio object.
+        '''
+        samples = np.ascontiguousarray(audio.audio)
+        digest = hashlib.sha256(samples.tobytes())
+        digest.update(f'{samples.dtype}{samples.shape}{audio.sample_rate}'.encode())
+        return digest.hexdigest()
+
+    @property
+    def timbre(self):
+        '''
+        Returns the list of (overtone, amplitude) pairs, as Performer and Synthesis take them; from windowed(), each amplitude is an array over time.
+        '''
+        amplitudes = self.amplitudes.tolist() if self.amplitudes.ndim == 1 else list(self.amplitudes)
+        return list(zip(self.overtones.tolist(), amplitudes))
+
+    def save(self, file):
+        np.savez(file, overtones=self.overtones, amplitudes=self.amplitudes, sample_rate=self.sample_rate)
+
+    @classmethod
+    def load(cls, file):
+        '''
+        Returns a Timbre saved with save(), without analyzing anything; its `audio` is None.
+        '''
+        profile = np.load(file)
+
+        timbre = cls.__new__(cls)
+        timbre.audio = None
+        timbre.audio_to_process = None
+        timbre.sample_rate = profile['sample_rate'].item()
+        timbre.overtones = profile['overtones']
+        timbre.amplitudes = profile['amplitudes']
+        return timbre
+
+    @classmethod
+    def windowed(cls, audio, frame_length=2048, hop_length=512, partials=8, fundamental=None, workers=None):
+        '''
+        A short-time analysis for long recordings: rather than one FFT over the whole recording, the audio is analyzed in windowed frames `hop_length` samples apart, a batch of frames at a time (in parallel over `workers` threads), so memory stays bounded however long the recording is.
+
+        Returns a Timbre whose `overtones` are the first `partials` harmonics of `fundamental` (by default, estimated from the average spectrum in a first pass) and whose `amplitudes` are shaped (partials, frames), i.e. how loud each partial is over time, scaled so the loudest is 1. Synthesis stretches each amplitude curve over every note.
+        '''
+        signal = audio.audio
+        sample_rate = audio.sample_rate
+
+        window = np.hanning(frame_length)
+        frequencies = np.fft.rfftfreq(frame_length, 1 / sample_rate)
+
+        def spectra(frames):
+            return np.abs(np.fft.rfft(frames * window, axis=1))
+
+        if fundamental is None:
+            average_spectrum = map_frames(
+                lambda frames: spectra(frames).sum(axis=0, keepdims=True),
+                signal, frame_length, hop_length, workers=workers
+                ).sum(axis=0)
+            fundamental = cls._estimate_fundamental(average_spectrum, frequencies)
+
+        harmonics = fundamental * np.arange(1, partials + 1)
+        harmonics = harmonics[harmonics < sample_rate / 2]
+
+        # each partial's amplitude is the strongest bin within a couple of bins of where it should be
+        nearest_bins = np.rint(harmonics / frequencies[1]).astype('int')
+        neighbourhoods = np.clip(nearest_bins[:, None] + np.arange(-2, 3)[None, :], 0, frequencies.size - 1)
+
+        amplitudes = map_frames(
+            lambda frames: spectra(frames)[:, neighbourhoods].max(axis=2),
+            signal, frame_length, hop_length, workers=workers
+            ).T
+
+        loudest = np.max(amplitudes)
+        if loudest > 0:
+            amplitudes = amplitudes / loudest
+
+        timbre = cls.__new__(cls)
+        timbre.audio = audio
+        timbre.audio_to_process = signal
+        timbre.sample_rate = sample_rate
+        timbre.fundamental = fundamental
+        timbre.overtones = np.arange(1, harmonics.size + 1, dtype='float')
+        timbre.amplitudes = amplitudes
+        return timbre
+
+    @staticmethod
+    def _estimate_fundamental(spectrum, frequencies, harmonics=5, fmin=20, fmax=3000):
+        '''
+        Returns the fundamental frequency of a magnitude spectrum by its harmonic product spectrum, refined by where its harmonics actually peak.
+        '''
+        candidates = np.arange(1, spectrum.size // harmonics)
+        log_spectrum = np.log(spectrum + 1e-12)
+        harmonic_product = np.sum([log_spectrum[candidates * k] for k in range(1, harmonics + 1)], axis=0)
+
+        # the fundamental itself has to be present, else the product spectrum often lands an octave low
+        present = spectrum[candidates] >= 0.1 * np.max(spectrum[1:])
+        in_range = (frequencies[candidates] >= fmin) & (frequencies[candidates] <= fmax) & present
+        best = candidates[in_range][np.argmax(harmonic_product[in_range])]
+
+        # each harmonic's peak, divided by its number, is an estimate of the fundamental finer than one bin
+        estimates = []
+        weights = []
+        for k in range(1, harmonics + 1):
+            low, high = max(k * best - k, 1), min(k * best + k + 1, spectrum.size)
+            peak = low + np.argmax(spectrum[low:high])
+            # a parabola through the peak bin and its neighbours places the peak between bins
+            if 0 < peak < spectrum.size - 1:
+                a, b, c = log_spectrum[peak - 1:peak + 2]
+                offset = 0.5 * (a - c) / (a - 2 * b + c) if a - 2 * b + c != 0 else 0
+            else:
+                offset = 0
+            estimates.append((peak + offset) * frequencies[1] / k)
+            weights.append(spectrum[peak] * k)
+
+        return float(np.average(estimates, weights=weights))
 
     # TODO: need to implement this downsampling
     def _downsample_audio(self):
         # downsample audio for speed; has the added benefit of excluding relatively high frequencies
-        return librosa.resample(
-            self.audio.audio,
-            orig_sr=self.audio.sample_rate,
-            target_sr=5512
-        )
+        return Resampler(self.audio.sample_rate, 5512).resample(self.audio.audio)
 
     def _get_timbre(self): 
         '''
-        Returns tuple of tuples: the first number provides the harmonic overtone, the second number provides the corresponding amplitude of a the give overtone.
+        Returns two arrays: the first provides the harmonic overtones, the second provides the corresponding amplitude of a the give overtone.
 
-        >> [(1, 0.75), (2, 0.5), (4, 0.5), (8, 0.1)]
+        >> [1, 2, 4, 8], [0.75, 0.5, 0.5, 0.1]
 
         The first index is the fundamental and its corresponding amplitude as scaled by scale_linearly(). Additional entries in this output provide the factor to multiply the fundamental by for each harmonic overtone and, of course, the corresponding amplitude_list as well.
         '''
 
+        import librosa
+        from scipy.signal import find_peaks_cwt
+        from scipy.stats import mode
+
         # get the spectrum for the real fft, dft sample frequencies, and the absolute values of the spectrum
         N = self.audio_to_process.shape[0]
         spectrum = np.fft.rfft(self.audio_to_process)
@@ -78,4 +227,9 @@ class Timbre:
         scaled_amplitudes_maxima = amplitudes_maxima
         overtones = _get_overtone_factors(frequencies_maxima)
 
-        return zip(overtones, scaled_amplitudes_maxima)
+        overtones = np.ravel(overtones).astype('float')
+        scaled_amplitudes_maxima = np.ravel(scaled_amplitudes_maxima).astype('float')
+
+        # pair them up as zip() would, i.e. up to the shorter of the two
+        pairs = min(overtones.size, scaled_amplitudes_maxima.size)
+        return overtones[:pairs], scaled_amplitudes_maxima[:pairs]
@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+def frame_batches(signal, frame_length, hop_length, batch_size=256):
+    '''
+    Yields the frames of `signal`, `hop_length` samples apart, in batches of up to `batch_size` frames shaped (frames, frame_length).
+    Frames are views into `signal` rather than copies, so memory stays bounded by the batch however long the signal is. Samples after the last whole frame are left out; a signal shorter than one frame is padded with silence.
+    '''
+    if signal.size < frame_length:
+        signal = np.pad(signal, (0, frame_length - signal.size))
+
+    frames = np.lib.stride_tricks.sliding_window_view(signal, frame_length)[::hop_length]
+    for start in range(0, frames.shape[0], batch_size):
+        yield frames[start:start + batch_size]
+
+
+def map_frames(function, signal, frame_length, hop_length, batch_size=256, workers=None):
+    '''
+    Applies `function` to each batch from frame_batches() and returns the results concatenated along the first axis, in order.
+    With more than one worker, batches are processed in parallel threads; numpy's FFT releases the GIL, so spectral analysis scales across cores.
+    '''
+    batches = frame_batches(signal, frame_length, hop_length, batch_size)
+
+    if workers is None or workers <= 1:
+        return np.concatenate([function(b) for b in batches])
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return np.concatenate(list(executor.map(function, batches)))